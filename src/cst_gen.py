@@ -2,7 +2,10 @@ from pathlib import Path
 from tree_sitter import Language, Parser, Query, QueryCursor
 import tree_sitter_c as tsc
 from dataclasses import dataclass, field
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+
+from src.preprocess import LineMap, Preprocessor, source_line
+from src.struct_hash import FunctionInterner, cst_hash, cst_path, resolve_path
 
 
 C_LANGUAGE = Language(tsc.language())
@@ -14,7 +17,7 @@ class CFGNode:
     id: int
     type: str
     code: str
-    line: int
+    anchor: Tuple[int, ...]  # 함수 본문에서 이 노드의 CST 노드까지의 경로 (cst_path)
     successors: List[int] = field(default_factory=list)
 
 
@@ -25,11 +28,20 @@ class Function:
     end_line: int
     calls: List[str]
     cfg: List[CFGNode]
+    body_line: int = 0
+    body_hash: str = ''
+    cfg_hash: str = ''
+    lines: List[int] = field(default_factory=list)  # CFG 노드 id -> 이 함수에서의 원본 줄
+    
+    def line_of(self, node: CFGNode) -> int:
+        return self.lines[node.id]
 
 
 class CFGBuilder:
-    def __init__(self, source_bytes: bytes):
+    def __init__(self, source_bytes: bytes, line_map: Optional[LineMap] = None):
         self.src = source_bytes
+        self.line_map = line_map
+        self.body = None
         self.node_id = 0
         self.cfg_nodes = []
         
@@ -38,8 +50,10 @@ class CFGBuilder:
             return ""
         return self.src[node.start_byte:node.end_byte].decode('utf8')
     
-    def new_node(self, node_type: str, code: str, line: int) -> CFGNode:
-        node = CFGNode(self.node_id, node_type, code, line)
+    def new_node(self, node_type: str, code: str, ts_node) -> CFGNode:
+        # 줄 번호 대신 CST 경로를 저장해, 본문이 같은 함수들이 이 CFG를 공유해도
+        # 각자 자기 본문에서 줄을 찾을 수 있게 한다 (CodeAnalyzer._cfg_lines)
+        node = CFGNode(self.node_id, node_type, code, cst_path(ts_node, self.body))
         self.node_id += 1
         self.cfg_nodes.append(node)
         return node
@@ -47,9 +61,10 @@ class CFGBuilder:
     def build_cfg(self, body_node) -> List[CFGNode]:
         self.cfg_nodes = []
         self.node_id = 0
+        self.body = body_node
         
-        entry = self.new_node('entry', 'ENTRY', body_node.start_point[0])
-        exit_node = self.new_node('exit', 'EXIT', body_node.end_point[0])
+        entry = self.new_node('entry', 'ENTRY', body_node)
+        exit_node = self.new_node('exit', 'EXIT', body_node)
         
         last_nodes = [entry]
         for stmt in body_node.named_children:
@@ -64,6 +79,10 @@ class CFGBuilder:
     def _process_statement(self, stmt, predecessors: List[CFGNode], 
                           exit_node: CFGNode) -> List[CFGNode]:
         
+        # 주석은 제어 흐름에 영향이 없고 본문 해시(cst_hash)에서도 제외되므로 CFG에 넣지 않는다
+        if stmt.type == 'comment':
+            return predecessors
+        
         if stmt.type == 'if_statement':
             return self._process_if(stmt, predecessors, exit_node)
         
@@ -76,13 +95,14 @@ class CFGBuilder:
         if stmt.type == 'expression_statement':
             return self._process_expression(stmt, predecessors)
         
-        if stmt.type == 'compound_statement':
+        # tree-sitter-c는 if의 alternative에 else_clause를 두므로 안쪽 문장으로 내려간다
+        if stmt.type in ('compound_statement', 'else_clause'):
             last = predecessors
             for child in stmt.named_children:
                 last = self._process_statement(child, last, exit_node)
             return last
         
-        node = self.new_node('statement', self.text(stmt), stmt.start_point[0])
+        node = self.new_node('statement', self.text(stmt), stmt)
         for pred in predecessors:
             pred.successors.append(node.id)
         return [node]
@@ -95,7 +115,7 @@ class CFGBuilder:
         cond_node = self.new_node(
             'condition',
             self.text(cond),
-            cond.start_point[0] if cond else if_stmt.start_point[0]
+            cond if cond else if_stmt
         )
         for pred in predecessors:
             pred.successors.append(cond_node.id)
@@ -115,7 +135,7 @@ class CFGBuilder:
         cond_node = self.new_node(
             'condition',
             self.text(cond) if cond else 'loop',
-            loop_stmt.start_point[0]
+            loop_stmt
         )
         for pred in predecessors:
             pred.successors.append(cond_node.id)
@@ -128,7 +148,7 @@ class CFGBuilder:
         return [cond_node]
     
     def _process_return(self, ret_stmt, predecessors, exit_node) -> List[CFGNode]:
-        node = self.new_node('return', self.text(ret_stmt), ret_stmt.start_point[0])
+        node = self.new_node('return', self.text(ret_stmt), ret_stmt)
         for pred in predecessors:
             pred.successors.append(node.id)
         node.successors.append(exit_node.id)
@@ -138,7 +158,7 @@ class CFGBuilder:
         is_call = self._has_call_expression(expr_stmt)
         node_type = 'call' if is_call else 'statement'
         
-        node = self.new_node(node_type, self.text(expr_stmt), expr_stmt.start_point[0])
+        node = self.new_node(node_type, self.text(expr_stmt), expr_stmt)
         for pred in predecessors:
             pred.successors.append(node.id)
         return [node]
@@ -150,11 +170,25 @@ class CFGBuilder:
 
 
 class CodeAnalyzer:
-    def __init__(self, source_code: str):
+    def __init__(self, source_code: str, line_map: Optional[LineMap] = None,
+                 interner: Optional[FunctionInterner] = None):
         self.code = source_code
         self.src = source_code.encode('utf-8')
+        self.line_map = line_map
+        self.interner = interner if interner is not None else FunctionInterner()
         self.tree = parser.parse(self.src)
         self.functions: Dict[str, Function] = {}
+    
+    @classmethod
+    def from_file(cls, path: str, preprocessor: Optional[Preprocessor] = None,
+                  interner: Optional[FunctionInterner] = None) -> 'CodeAnalyzer':
+        """preprocessor가 주어지면 매크로/#ifdef를 확장한 코드를 분석하고, 실패하면 원본을 분석"""
+        code = Path(path).read_text(encoding='utf-8')
+        if preprocessor is not None:
+            pre = preprocessor.preprocess(path, code)
+            if pre is not None:
+                return cls(pre.code, pre.line_map, interner)
+        return cls(code, interner=interner)
         
     def text(self, node) -> str:
         if not node:
@@ -179,20 +213,41 @@ class CodeAnalyzer:
             func_name_node = captures['func_name'][0]
             body_node = captures['body'][0]
             
+            # 헤더에서 확장되어 들어온 정의는 건너뜀
+            if self.line_map and not self.line_map.in_main_file(func_name_node.start_point[0]):
+                continue
+            
             func_name = self.text(func_name_node)
             
-            builder = CFGBuilder(self.src)
-            cfg = builder.build_cfg(body_node)
-            calls = self._extract_calls(body_node)
+            # 본문이 같은 함수는 CFG와 호출 목록을 한 번만 만들어 공유하고, 줄 번호만 함수마다 따로 둔다
+            body_hash = cst_hash(body_node, self.src)
+            body = self.interner.intern(body_hash, lambda: (
+                CFGBuilder(self.src, self.line_map).build_cfg(body_node),
+                self._extract_calls(body_node),
+            ))
             
             self.functions[func_name] = Function(
                 name=func_name,
-                start_line=func_name_node.start_point[0],
-                end_line=body_node.end_point[0],
-                calls=calls,
-                cfg=cfg
+                start_line=source_line(func_name_node.start_point, self.line_map),
+                end_line=source_line(body_node.end_point, self.line_map),
+                calls=body.calls,
+                cfg=body.cfg,
+                body_line=source_line(body_node.start_point, self.line_map),
+                body_hash=body_hash,
+                cfg_hash=body.cfg_hash,
+                lines=self._cfg_lines(body_node, body.cfg),
             )
     
+    def _cfg_lines(self, body_node, cfg: List[CFGNode]) -> List[int]:
+        lines = []
+        for node in cfg:
+            if node.type == 'exit':
+                point = body_node.end_point
+            else:
+                point = resolve_path(body_node, node.anchor).start_point
+            lines.append(source_line(point, self.line_map))
+        return lines
+    
     def _extract_calls(self, node) -> List[str]:
         calls = []
         
@@ -244,9 +299,11 @@ class CodeAnalyzer:
 
 
 def get_call_graph_with_cfg():
-    code = Path("/Users/ihkang/workspace/paper/mavul/test-neo4j/auth.c").read_text()
-    
-    analyzer = CodeAnalyzer(code)
+    with Preprocessor() as preprocessor:
+        analyzer = CodeAnalyzer.from_file(
+            "/Users/ihkang/workspace/paper/mavul/test-neo4j/auth.c",
+            preprocessor=preprocessor,
+        )
     analyzer.analyze()
     analyzer.print_analysis()
     analyzer.print_call_graph()
@@ -0,0 +1,392 @@
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Optional, Set, Tuple
+
+from src.cst_gen import CFGNode, Function, CodeAnalyzer
+from src.preprocess import Preprocessor
+from src.struct_hash import FunctionInterner, normalize
+
+
+Edge = Tuple[str, str, str]  # (src key, relationship type, dst key)
+
+NODE_LABELS = {
+    'entry': 'Entry',
+    'exit': 'Exit',
+    'condition': 'Condition',
+    'call': 'Call',
+    'return': 'Return',
+    'statement': 'Statement',
+}
+
+# 관계 타입별 (시작 노드 라벨, 끝 노드 라벨). 나머지는 CFG 내부 엣지
+EDGE_ENDPOINTS = {
+    'CALLS': ('Function', 'Function'),
+    'ENTRY': ('Function', 'CFGNode'),
+    'HAS_CONDITION': ('Function', 'CFGNode'),
+}
+
+CALLEE = re.compile(r'([A-Za-z_]\w*)\s*\(')
+
+
+@dataclass
+class GraphNode:
+    key: str
+    labels: Tuple[str, ...]
+    props: Dict[str, object]
+
+
+@dataclass
+class CFGGraph:
+    """CFG 해시 하나당 한 벌만 저장되는 CFG 노드/엣지 묶음. 본문이 같은 함수들이 공유한다.
+
+    키는 공유하는 함수 중 키가 가장 작은 함수(owner)에서 정해지므로, 본문이 바뀌어도 키가 유지되어
+    노드 단위로 diff할 수 있다. 줄 번호는 함수마다 다르므로 담지 않는다(Function.body_line 참고).
+    """
+    key: str
+    cfg_hash: str
+    nodes: Dict[str, GraphNode] = field(default_factory=dict)
+    edges: Set[Edge] = field(default_factory=set)
+
+
+@dataclass
+class FunctionGraph:
+    """함수 노드와 함수에서 나가는 엣지(CALLS, 공유 CFG로의 ENTRY/HAS_CONDITION)"""
+    key: str
+    cfg: str
+    node: GraphNode
+    edges: Set[Edge] = field(default_factory=set)
+
+
+@dataclass
+class IndexStats:
+    files: int = 0
+    functions: int = 0
+    unique_bodies: int = 0
+    unique_cfgs: int = 0
+    cfg_nodes_total: int = 0
+    cfg_nodes_stored: int = 0
+    preprocess_hits: int = 0
+    preprocess_misses: int = 0
+
+    @property
+    def dedupe_ratio(self) -> float:
+        """CST 해시 기준: CFG 빌드를 건너뛴 함수 비율"""
+        if not self.functions:
+            return 0.0
+        return 1 - self.unique_bodies / self.functions
+
+    @property
+    def cfg_dedupe_ratio(self) -> float:
+        """CFG 해시 기준: 그래프에서 CFG를 공유한 함수 비율 (cfg_nodes_stored와 같은 기준)"""
+        if not self.functions:
+            return 0.0
+        return 1 - self.unique_cfgs / self.functions
+
+    def print_stats(self):
+        print(f"[index] files: {self.files}, functions: {self.functions}, "
+              f"unique bodies: {self.unique_bodies} (dedupe {self.dedupe_ratio:.1%}), "
+              f"unique cfgs: {self.unique_cfgs} (dedupe {self.cfg_dedupe_ratio:.1%})")
+        print(f"[index] cfg nodes: {self.cfg_nodes_stored} stored / {self.cfg_nodes_total} total, "
+              f"include-set cache: {self.preprocess_hits} hits / {self.preprocess_misses} misses")
+
+
+@dataclass
+class GraphSnapshot:
+    functions: Dict[str, FunctionGraph] = field(default_factory=dict)
+    cfgs: Dict[str, CFGGraph] = field(default_factory=dict)
+    externals: Dict[str, GraphNode] = field(default_factory=dict)
+    stats: Optional[IndexStats] = None
+
+    def save(self, path: str):
+        data = {
+            'functions': [_function_to_json(fg) for fg in self.functions.values()],
+            'cfgs': [_cfg_to_json(cg) for cg in self.cfgs.values()],
+            'externals': [_node_to_json(n) for n in self.externals.values()],
+        }
+        Path(path).write_text(json.dumps(data), encoding='utf-8')
+
+    @staticmethod
+    def load(path: str) -> 'GraphSnapshot':
+        data = json.loads(Path(path).read_text(encoding='utf-8'))
+        snapshot = GraphSnapshot()
+        for item in data['functions']:
+            fg = _function_from_json(item)
+            snapshot.functions[fg.key] = fg
+        for item in data['cfgs']:
+            cg = _cfg_from_json(item)
+            snapshot.cfgs[cg.key] = cg
+        for item in data['externals']:
+            node = _node_from_json(item)
+            snapshot.externals[node.key] = node
+        return snapshot
+
+
+@dataclass
+class GraphDiff:
+    added_nodes: List[GraphNode] = field(default_factory=list)
+    removed_nodes: List[GraphNode] = field(default_factory=list)
+    updated_nodes: List[GraphNode] = field(default_factory=list)
+    added_edges: List[Edge] = field(default_factory=list)
+    removed_edges: List[Edge] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not (self.added_nodes or self.removed_nodes or self.updated_nodes
+                    or self.added_edges or self.removed_edges)
+
+    def print_diff(self):
+        print("=" * 60)
+        print("GRAPH DIFF")
+        print("=" * 60)
+        for node in self.added_nodes:
+            print(f"  + {':'.join(node.labels):20s} {node.key}")
+        for node in self.removed_nodes:
+            print(f"  - {':'.join(node.labels):20s} {node.key}")
+        for node in self.updated_nodes:
+            print(f"  ~ {':'.join(node.labels):20s} {node.key}")
+        for src, rel, dst in self.added_edges:
+            print(f"  + {src} -[:{rel}]-> {dst}")
+        for src, rel, dst in self.removed_edges:
+            print(f"  - {src} -[:{rel}]-> {dst}")
+
+
+def build_snapshot(root: str, preprocessor: Optional[Preprocessor] = None) -> GraphSnapshot:
+    """root 아래의 모든 .c 파일을 분석해 스냅샷 생성. 키는 root 기준 상대 경로라 리비전 간에 안정적"""
+    root_path = Path(root)
+    interner = FunctionInterner()
+    analyzed = {}
+    for path in sorted(root_path.rglob('*.c')):
+        analyzer = CodeAnalyzer.from_file(str(path), preprocessor, interner)
+        analyzed[path.relative_to(root_path).as_posix()] = analyzer.analyze()
+
+    snapshot = snapshot_from_functions(analyzed)
+    snapshot.stats = IndexStats(
+        files=len(analyzed),
+        functions=interner.functions,
+        unique_bodies=interner.unique,
+        unique_cfgs=len(snapshot.cfgs),
+        cfg_nodes_total=sum(len(f.cfg) for fs in analyzed.values() for f in fs.values()),
+        cfg_nodes_stored=sum(len(cg.nodes) for cg in snapshot.cfgs.values()),
+        preprocess_hits=preprocessor.hits if preprocessor else 0,
+        preprocess_misses=preprocessor.misses if preprocessor else 0,
+    )
+    return snapshot
+
+
+def snapshot_from_functions(analyzed: Dict[str, Dict[str, Function]]) -> GraphSnapshot:
+    """{파일 경로: CodeAnalyzer.analyze() 결과} -> GraphSnapshot"""
+    snapshot = GraphSnapshot()
+
+    # 호출 대상 해석: 같은 파일 정의 우선, 없으면 다른 파일의 정의, 그래도 없으면 외부 함수
+    defined: Dict[str, str] = {}
+    for path, functions in analyzed.items():
+        for name in functions:
+            defined.setdefault(name, function_key(path, name))
+
+    # 같은 CFG를 공유하는 함수들 중 키가 가장 작은 함수를 owner로 (처리 순서와 무관하게 결정적)
+    owners: Dict[str, str] = {}
+    for path, functions in analyzed.items():
+        for name, func in functions.items():
+            key = function_key(path, name)
+            if func.cfg_hash not in owners or key < owners[func.cfg_hash]:
+                owners[func.cfg_hash] = key
+
+    for path, functions in analyzed.items():
+        for name, func in functions.items():
+            key = function_key(path, name)
+            cg = snapshot.cfgs.get(cfg_key(owners[func.cfg_hash]))
+            if cg is None:
+                cg = _cfg_graph(cfg_key(owners[func.cfg_hash]), func)
+                snapshot.cfgs[cg.key] = cg
+            fg = _function_graph(key, path, func, cg)
+
+            for callee in func.calls:
+                if callee in functions:
+                    callee_key = function_key(path, callee)
+                elif callee in defined:
+                    callee_key = defined[callee]
+                else:
+                    callee_key = function_key('', callee)
+                    snapshot.externals[callee_key] = GraphNode(
+                        callee_key, ('Function',), {'key': callee_key, 'name': callee}
+                    )
+                fg.edges.add((key, 'CALLS', callee_key))
+
+            snapshot.functions[key] = fg
+    return snapshot
+
+
+def diff_snapshots(old: GraphSnapshot, new: GraphSnapshot) -> GraphDiff:
+    """두 스냅샷 사이에서 추가/삭제/변경된 노드와 엣지만 계산.
+
+    CFG 해시가 같으면 노드 단위 비교 없이 건너뛰고, 다르면 내용 기반 노드 키로 바뀐 노드만 찾는다.
+    """
+    diff = GraphDiff()
+
+    for key in old.cfgs.keys() | new.cfgs.keys():
+        o = old.cfgs.get(key)
+        n = new.cfgs.get(key)
+
+        if o is None:
+            diff.added_nodes.extend(n.nodes.values())
+            diff.added_edges.extend(n.edges)
+        elif n is None:
+            diff.removed_nodes.extend(o.nodes.values())
+            diff.removed_edges.extend(o.edges)
+        elif o.cfg_hash != n.cfg_hash:
+            for node_key in o.nodes.keys() - n.nodes.keys():
+                diff.removed_nodes.append(o.nodes[node_key])
+            for node_key, node in n.nodes.items():
+                prev = o.nodes.get(node_key)
+                if prev is None:
+                    diff.added_nodes.append(node)
+                elif prev.props != node.props:
+                    diff.updated_nodes.append(node)
+            diff.added_edges.extend(n.edges - o.edges)
+            diff.removed_edges.extend(o.edges - n.edges)
+
+    for key in old.functions.keys() | new.functions.keys():
+        o = old.functions.get(key)
+        n = new.functions.get(key)
+
+        if o is None:
+            diff.added_nodes.append(n.node)
+            diff.added_edges.extend(n.edges)
+        elif n is None:
+            diff.removed_nodes.append(o.node)
+            diff.removed_edges.extend(o.edges)
+        else:
+            if o.node.props != n.node.props:
+                diff.updated_nodes.append(n.node)
+            diff.added_edges.extend(n.edges - o.edges)
+            diff.removed_edges.extend(o.edges - n.edges)
+
+    for key in new.externals.keys() - old.externals.keys():
+        diff.added_nodes.append(new.externals[key])
+    for key in old.externals.keys() - new.externals.keys():
+        diff.removed_nodes.append(old.externals[key])
+
+    return diff
+
+
+def edge_labels(rel: str) -> Tuple[str, str]:
+    return EDGE_ENDPOINTS.get(rel, ('CFGNode', 'CFGNode'))
+
+
+def function_key(path: str, name: str) -> str:
+    return f"{path}:{name}"
+
+
+def cfg_key(owner: str) -> str:
+    return f"cfg:{owner}"
+
+
+def _function_graph(key: str, path: str, func: Function, cg: CFGGraph) -> FunctionGraph:
+    node = GraphNode(key, ('Function',), {
+        'key': key,
+        'name': func.name,
+        'file': path,
+        'start_line': func.start_line,
+        'end_line': func.end_line,
+        'body_line': func.body_line,
+    })
+    fg = FunctionGraph(key, cg.key, node)
+    for node_key, cfg_node in cg.nodes.items():
+        if cfg_node.props['type'] == 'condition':
+            fg.edges.add((key, 'HAS_CONDITION', node_key))
+        elif cfg_node.props['type'] == 'entry':
+            fg.edges.add((key, 'ENTRY', node_key))
+    return fg
+
+
+def _cfg_graph(key: str, func: Function) -> CFGGraph:
+    cg = CFGGraph(key, func.cfg_hash)
+    types = {cfg_node.id: cfg_node.type for cfg_node in func.cfg}
+
+    # CFG 노드 키: CFG 키 + 타입 + 코드 해시 + 같은 (타입, 코드) 안에서의 순번
+    # id 대신 내용 기반 키를 써야 앞쪽에 문장이 추가돼도 나머지 노드가 그대로 매칭된다
+    keys: Dict[int, str] = {}
+    seen: Dict[Tuple[str, str], int] = {}
+    for cfg_node in func.cfg:
+        code = normalize(cfg_node.code)
+        n = seen.get((cfg_node.type, code), 0)
+        seen[(cfg_node.type, code)] = n + 1
+        digest = hashlib.sha1(code.encode('utf-8')).hexdigest()[:12]
+        keys[cfg_node.id] = f"{cg.key}#{cfg_node.type}:{digest}:{n}"
+
+    for cfg_node in func.cfg:
+        node_key = keys[cfg_node.id]
+        cg.nodes[node_key] = GraphNode(
+            node_key,
+            ('CFGNode', NODE_LABELS.get(cfg_node.type, 'Statement')),
+            _cfg_props(node_key, cfg_node),
+        )
+
+        for i, succ in enumerate(cfg_node.successors):
+            succ_key = keys[succ]
+            if cfg_node.type == 'condition':
+                rel = 'IF_TRUE' if i == 0 else 'IF_FALSE'
+            elif types[succ] == 'return':
+                rel = 'RETURNS'
+            else:
+                rel = 'NEXT'
+            cg.edges.add((node_key, rel, succ_key))
+
+    return cg
+
+
+def _cfg_props(key: str, node: CFGNode) -> Dict[str, object]:
+    # cfg_hash와 같은 정규화된 코드를 저장해야, 해시가 같아 diff를 건너뛴 CFG의 값이 낡지 않는다
+    code = normalize(node.code)
+    props = {'key': key, 'type': node.type, 'code': code}
+    if node.type == 'condition':
+        props['expression'] = code
+    elif node.type == 'call':
+        m = CALLEE.search(code)
+        props['function'] = m.group(1) if m else code
+    elif node.type == 'return':
+        props['value'] = code.removeprefix('return').rstrip(';').strip()
+    return props
+
+
+def _node_to_json(node: GraphNode) -> dict:
+    return {'key': node.key, 'labels': list(node.labels), 'props': node.props}
+
+
+def _node_from_json(item: dict) -> GraphNode:
+    return GraphNode(item['key'], tuple(item['labels']), item['props'])
+
+
+def _function_to_json(fg: FunctionGraph) -> dict:
+    return {
+        'key': fg.key,
+        'cfg': fg.cfg,
+        'node': _node_to_json(fg.node),
+        'edges': sorted(fg.edges),
+    }
+
+
+def _function_from_json(item: dict) -> FunctionGraph:
+    fg = FunctionGraph(item['key'], item['cfg'], _node_from_json(item['node']))
+    fg.edges = {tuple(e) for e in item['edges']}
+    return fg
+
+
+def _cfg_to_json(cg: CFGGraph) -> dict:
+    return {
+        'key': cg.key,
+        'cfg_hash': cg.cfg_hash,
+        'nodes': [_node_to_json(n) for n in cg.nodes.values()],
+        'edges': sorted(cg.edges),
+    }
+
+
+def _cfg_from_json(item: dict) -> CFGGraph:
+    cg = CFGGraph(item['key'], item['cfg_hash'])
+    for n in item['nodes']:
+        node = _node_from_json(n)
+        cg.nodes[node.key] = node
+    cg.edges = {tuple(e) for e in item['edges']}
+    return cg
@@ -1,7 +1,12 @@
+import os
+from collections import defaultdict
+
 from langchain_core.tools import tool
 
 from neo4j import GraphDatabase
 
+from src.graph_diff import GraphDiff, GraphSnapshot, build_snapshot, diff_snapshots, edge_labels
+
 uri = "bolt://localhost:7687"
 user = "neo4j"
 password = "1234aaaa" 
@@ -53,6 +58,82 @@ def delete_all(tx):
     tx.run('match (n) detach delete n')
 
 
+def delete_unkeyed(tx):
+    # key 없이 적재된 이전 노드(샘플 데이터, 전체 재적재 결과)만 지운다
+    tx.run('MATCH (n) WHERE n.key IS NULL DETACH DELETE n')
+
+
+def create_indexes(tx):
+    tx.run('CREATE INDEX function_key IF NOT EXISTS FOR (n:Function) ON (n.key)')
+    tx.run('CREATE INDEX cfg_node_key IF NOT EXISTS FOR (n:CFGNode) ON (n.key)')
+
+
+def apply_diff(tx, diff: GraphDiff):
+    """delete_all + 전체 재적재 대신 diff에 포함된 노드/엣지만 반영"""
+    removed_edges = defaultdict(list)
+    for src, rel, dst in diff.removed_edges:
+        removed_edges[(rel, *edge_labels(rel))].append([src, dst])
+    for (rel, src_label, dst_label), edges in removed_edges.items():
+        tx.run(f"""
+        UNWIND $edges AS e
+        MATCH (a:{src_label} {{key: e[0]}})-[r:{rel}]->(b:{dst_label} {{key: e[1]}})
+        DELETE r
+        """, edges=edges)
+
+    removed_nodes = defaultdict(list)
+    for node in diff.removed_nodes:
+        removed_nodes[node.labels[0]].append(node.key)
+    for label, keys in removed_nodes.items():
+        tx.run(f"""
+        UNWIND $keys AS k
+        MATCH (n:{label} {{key: k}})
+        DETACH DELETE n
+        """, keys=keys)
+
+    upserts = defaultdict(list)
+    for node in diff.added_nodes + diff.updated_nodes:
+        upserts[node.labels].append({'key': node.key, 'props': node.props})
+    for labels, rows in upserts.items():
+        extra = ''.join(f'SET n:{label} ' for label in labels[1:])
+        tx.run(f"""
+        UNWIND $rows AS row
+        MERGE (n:{labels[0]} {{key: row.key}})
+        SET n = row.props
+        {extra}
+        """, rows=rows)
+
+    added_edges = defaultdict(list)
+    for src, rel, dst in diff.added_edges:
+        added_edges[(rel, *edge_labels(rel))].append([src, dst])
+    for (rel, src_label, dst_label), edges in added_edges.items():
+        tx.run(f"""
+        UNWIND $edges AS e
+        MATCH (a:{src_label} {{key: e[0]}})
+        MATCH (b:{dst_label} {{key: e[1]}})
+        MERGE (a)-[:{rel}]->(b)
+        """, edges=edges)
+
+
+def sync_revision(root: str, snapshot_path: str, preprocessor=None) -> GraphDiff:
+    """root를 분석해 직전 스냅샷과의 차이만 Neo4j에 반영하고 새 스냅샷을 저장"""
+    first_sync = not os.path.exists(snapshot_path)
+    old = GraphSnapshot() if first_sync else GraphSnapshot.load(snapshot_path)
+    new = build_snapshot(root, preprocessor)
+    new.stats.print_stats()
+    diff = diff_snapshots(old, new)
+
+    with driver.session(database="neo4j") as session:
+        # 첫 동기화: key가 없는 이전 적재 노드(샘플 데이터 등)가 name 조회에 섞이지 않도록 비운다
+        if first_sync:
+            session.execute_write(delete_unkeyed)
+        session.execute_write(create_indexes)
+        if not diff.is_empty():
+            session.execute_write(apply_diff, diff)
+
+    new.save(snapshot_path)
+    return diff
+
+
 def test():
     print(f'driver: {driver}')
 
@@ -121,7 +202,7 @@ def cfg_tool(function_name: str, branch: str = "IF_FALSE") -> str:
     
     query = f"""
     MATCH (f:Function {{name: $fname}})-[:HAS_CONDITION]->(c:Condition)
-    MATCH (c)-[:{branch}]->(callee)
+    MATCH (c)-[:{branch}]->(callee:Call)
     RETURN callee.function AS called
     """
     print(f'[cfg_tool] function_name: {function_name}, branch: {branch}')
@@ -0,0 +1,331 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+
+# cpp가 이해하는 옵션 중 전처리 결과에 영향을 주는 것만 남긴다
+FLAGS_WITH_VALUE = ('-I', '-D', '-U', '-include', '-imacros', '-isystem', '-iquote', '-idirafter')
+FLAG_PREFIXES = ('-std=',)
+
+LINEMARKER = re.compile(r'^#\s*(\d+)\s+"((?:[^"\\]|\\.)*)"')
+DEFINE = re.compile(r'^#define\s+([A-Za-z_]\w*)')
+UNDEF = re.compile(r'^#undef\s+([A-Za-z_]\w*)')
+PRELUDE_DIRECTIVE = re.compile(r'^#\s*(include|define|undef|pragma)\b')
+
+
+@dataclass
+class LineMap:
+    """확장된 코드의 각 줄(0-based)이 원본 어느 파일, 몇 번째 줄에서 왔는지"""
+    path: str
+    entries: List[Tuple[str, int]]
+
+    def origin(self, line: int) -> Tuple[str, int]:
+        if 0 <= line < len(self.entries):
+            return self.entries[line]
+        return self.path, line
+
+    def line(self, line: int) -> int:
+        return self.origin(line)[1]
+
+    def in_main_file(self, line: int) -> bool:
+        return self.origin(line)[0] == self.path
+
+
+def source_line(point, line_map: Optional[LineMap] = None) -> int:
+    """tree-sitter point의 줄을 원본 소스 줄 번호로 변환 (line_map이 없으면 그대로)"""
+    if line_map is None:
+        return point[0]
+    return line_map.line(point[0])
+
+
+@dataclass
+class PreprocessedSource:
+    code: str
+    line_map: LineMap
+
+
+@dataclass
+class IncludeSetEntry:
+    """include-set 하나에 대해 헤더를 한 번 확장해 얻은 매크로 테이블 파일과 의존 헤더의 mtime"""
+    macro_file: str
+    deps: Dict[str, float] = field(default_factory=dict)
+
+    def is_fresh(self) -> bool:
+        if not os.path.exists(self.macro_file):
+            return False
+        for dep, mtime in self.deps.items():
+            try:
+                if os.path.getmtime(dep) != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+
+class CompileCommands:
+    """compile_commands.json에서 파일별 컴파일러와 전처리 옵션을 꺼낸다"""
+
+    def __init__(self, db_path: str):
+        self.db_path = os.path.abspath(db_path)
+        self.entries: Dict[str, Tuple[List[str], List[str]]] = {}
+
+        for entry in json.loads(Path(self.db_path).read_text(encoding='utf-8')):
+            directory = entry.get('directory', os.path.dirname(self.db_path))
+            args = entry.get('arguments') or shlex.split(entry.get('command', ''))
+            if not args:
+                continue
+            file = os.path.normpath(os.path.join(directory, entry['file']))
+            self.entries[file] = ([args[0], '-E'], self._filter_flags(args[1:], directory))
+
+    @staticmethod
+    def find(start_dir: str) -> Optional['CompileCommands']:
+        cur = os.path.abspath(start_dir)
+        while True:
+            for candidate in ('compile_commands.json', 'build/compile_commands.json'):
+                db_path = os.path.join(cur, candidate)
+                if os.path.isfile(db_path):
+                    # 깨진 DB는 없는 것으로 취급하고 cpp 기본 설정으로 진행
+                    try:
+                        return CompileCommands(db_path)
+                    except (ValueError, KeyError, TypeError, OSError) as e:
+                        print(f'[preprocess] {db_path}: {e!r}')
+                        return None
+            parent = os.path.dirname(cur)
+            if parent == cur:
+                return None
+            cur = parent
+
+    def flags_for(self, path: str) -> Optional[Tuple[List[str], List[str]]]:
+        return self.entries.get(os.path.abspath(path))
+
+    @staticmethod
+    def _filter_flags(args: List[str], directory: str) -> List[str]:
+        flags = []
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg.startswith(FLAG_PREFIXES):
+                flags.append(arg)
+            else:
+                for opt in FLAGS_WITH_VALUE:
+                    if arg == opt and i + 1 < len(args):
+                        value = args[i + 1]
+                        i += 1
+                    elif arg.startswith(opt) and len(arg) > len(opt) and opt in ('-I', '-D', '-U'):
+                        value = arg[len(opt):]
+                    else:
+                        continue
+                    if opt not in ('-D', '-U'):
+                        value = os.path.normpath(os.path.join(directory, value))
+                    flags.extend([opt, value])
+                    break
+            i += 1
+        return flags
+
+
+def split_prelude(code: str) -> Tuple[List[str], str]:
+    """파일 앞쪽의 #include/#define 블록(prelude)과 나머지 본문을 분리.
+
+    본문에서는 prelude 줄을 빈 줄로 바꿔 원본 줄 번호를 유지한다.
+    """
+    lines = code.split('\n')
+    directives = []
+    i = end = 0
+    while i < len(lines):
+        s = lines[i].strip()
+        if not s or s.startswith('//'):
+            i += 1
+            continue
+        if s.startswith('/*'):
+            j = i
+            while '*/' not in lines[j] and j + 1 < len(lines):
+                j += 1
+            if lines[j].split('*/', 1)[-1].strip():
+                break
+            i = j + 1
+            continue
+        if not PRELUDE_DIRECTIVE.match(s):
+            break
+        j = i
+        while lines[j].rstrip().endswith('\\') and j + 1 < len(lines):
+            j += 1
+        directives.append('\n'.join(lines[i:j + 1]))
+        i = end = j + 1
+
+    body = '\n'.join([''] * end + lines[end:])
+    return directives, body
+
+
+class Preprocessor:
+    """로컬 cpp(또는 compile_commands.json의 컴파일러)로 C 파일을 전처리.
+
+    공통 헤더는 include-set(컴파일 옵션 + prelude 지시문) 단위로 한 번만 확장하고
+    매크로 테이블을 캐시해 두었다가, 각 파일 본문은 -imacros로 그 테이블만 읽어 확장한다.
+    cache_dir를 주면 매크로 테이블과 인덱스(index.json)가 그곳에 남아 다음 실행에서도 재사용된다.
+    """
+
+    def __init__(self, compile_commands: Optional[CompileCommands] = None,
+                 cpp: Optional[str] = None, cache_dir: Optional[str] = None):
+        self.compile_commands = compile_commands
+        self.cpp = cpp or shutil.which('cpp')
+        # cache_dir를 주지 않으면 인스턴스가 소유하는 임시 디렉터리를 쓰고 close()에서 지운다
+        self._tmpdir = None if cache_dir else tempfile.TemporaryDirectory(prefix='cst_cpp_')
+        self.cache_dir = cache_dir or self._tmpdir.name
+        self.cache: Dict[str, IncludeSetEntry] = self._load_index()
+        self._dbs: Dict[str, Optional[CompileCommands]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, 'index.json')
+
+    def _load_index(self) -> Dict[str, IncludeSetEntry]:
+        try:
+            data = json.loads(Path(self._index_path()).read_text(encoding='utf-8'))
+            return {
+                key: IncludeSetEntry(os.path.join(self.cache_dir, item['macro_file']), item['deps'])
+                for key, item in data.items()
+            }
+        except FileNotFoundError:
+            return {}
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            print(f'[preprocess] {self._index_path()}: {e!r}')
+            return {}
+
+    def _save_index(self):
+        data = {
+            key: {'macro_file': os.path.basename(entry.macro_file), 'deps': entry.deps}
+            for key, entry in self.cache.items()
+        }
+        Path(self._index_path()).write_text(json.dumps(data), encoding='utf-8')
+
+    def close(self):
+        self.cache.clear()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+    def __enter__(self) -> 'Preprocessor':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def preprocess(self, path: str, code: Optional[str] = None) -> Optional[PreprocessedSource]:
+        """전처리 결과를 반환. cpp를 쓸 수 없거나 실패하면 None"""
+        path = os.path.abspath(path)
+        if code is None:
+            code = Path(path).read_text(encoding='utf-8')
+
+        cmd, flags = self._command_for(path)
+        if cmd is None:
+            return None
+
+        directives, body = split_prelude(code)
+        quote_dir = ['-iquote', os.path.dirname(path)]
+
+        try:
+            entry = self._include_set(cmd, flags, directives, quote_dir)
+            out = self._run(cmd + flags + quote_dir + ['-imacros', entry.macro_file],
+                            f'# 1 "{path}"\n{body}')
+        except subprocess.CalledProcessError as e:
+            print(f'[preprocess] {path}: {e}\n{e.stderr.strip()}')
+            return None
+        except OSError as e:
+            print(f'[preprocess] {path}: {e}')
+            return None
+
+        code_lines, entries = self._strip_linemarkers(out, path)
+        return PreprocessedSource('\n'.join(code_lines), LineMap(path, entries))
+
+    def _command_for(self, path: str) -> Tuple[Optional[List[str]], List[str]]:
+        db = self.compile_commands
+        if db is None:
+            directory = os.path.dirname(path)
+            if directory not in self._dbs:
+                self._dbs[directory] = CompileCommands.find(directory)
+            db = self._dbs[directory]
+
+        found = db.flags_for(path) if db else None
+        if found:
+            return found
+        if self.cpp is None:
+            return None, []
+        return [self.cpp], []
+
+    def _include_set(self, cmd: List[str], flags: List[str], directives: List[str],
+                     quote_dir: List[str]) -> IncludeSetEntry:
+        # "..." include가 없으면 파일 위치와 무관하게 같은 include-set으로 공유
+        uses_quote = any(re.match(r'#\s*include\s*"', d) for d in directives)
+        key_src = json.dumps([cmd, flags, directives, quote_dir if uses_quote else []])
+        key = hashlib.sha1(key_src.encode('utf-8')).hexdigest()
+
+        entry = self.cache.get(key)
+        if entry and entry.is_fresh():
+            self.hits += 1
+            return entry
+        self.misses += 1
+
+        prelude = '\n'.join(directives) + '\n'
+        out = self._run(cmd + flags + (quote_dir if uses_quote else []) + ['-dD'], prelude)
+
+        macros: Dict[str, str] = {}
+        deps: Dict[str, float] = {}
+        current = ''
+        for line in out.split('\n'):
+            m = LINEMARKER.match(line)
+            if m:
+                current = m.group(2)
+                if not current.startswith('<') and os.path.exists(current):
+                    deps[current] = os.path.getmtime(current)
+                continue
+            if current in ('<built-in>', '<command-line>'):
+                continue
+            d = DEFINE.match(line)
+            if d:
+                macros[d.group(1)] = line
+                continue
+            u = UNDEF.match(line)
+            if u:
+                macros.pop(u.group(1), None)
+
+        macro_file = os.path.join(self.cache_dir, f'{key}.h')
+        Path(macro_file).write_text('\n'.join(macros.values()) + '\n', encoding='utf-8')
+
+        entry = IncludeSetEntry(macro_file, deps)
+        self.cache[key] = entry
+        self._save_index()
+        return entry
+
+    def _run(self, args: List[str], stdin: str) -> str:
+        result = subprocess.run(
+            args + ['-x', 'c', '-'],
+            input=stdin,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout
+
+    @staticmethod
+    def _strip_linemarkers(out: str, path: str) -> Tuple[List[str], List[Tuple[str, int]]]:
+        code_lines = []
+        entries = []
+        current, lineno = path, 0
+        for line in out.split('\n'):
+            m = LINEMARKER.match(line)
+            if m:
+                current, lineno = m.group(2), int(m.group(1)) - 1
+                continue
+            code_lines.append(line)
+            entries.append((current, lineno))
+            lineno += 1
+        return code_lines, entries
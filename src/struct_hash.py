@@ -0,0 +1,106 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Callable, List, Dict, Tuple
+
+
+# 의미에 영향을 주지 않는 노드는 해시에서 제외
+IGNORED_TYPES = ('comment',)
+
+
+def cst_hash(node, src: bytes) -> str:
+    """Merkle 방식의 CST 해시: 노드 타입 + (리프라면 토큰) + 자식 해시들.
+
+    위치/공백/주석은 포함하지 않으므로 복사된 함수 본문은 서식이 달라도 같은 해시를 갖는다.
+    재귀 한도를 피하려고 후위 순회를 스택으로 처리한다.
+    """
+    digests: Dict[int, bytes] = {}
+    stack = [(node, False)]
+    while stack:
+        cur, visited = stack.pop()
+        if not visited:
+            stack.append((cur, True))
+            for child in cur.children:
+                if child.type not in IGNORED_TYPES:
+                    stack.append((child, False))
+            continue
+
+        h = hashlib.sha1(cur.type.encode('utf-8'))
+        children = [c for c in cur.children if c.type not in IGNORED_TYPES]
+        if children:
+            for child in children:
+                h.update(digests.pop(child.id))
+        else:
+            h.update(b'\0' + src[cur.start_byte:cur.end_byte])
+        digests[cur.id] = h.digest()
+
+    return digests[node.id].hex()
+
+
+def _children(node) -> List:
+    return [c for c in node.children if c.type not in IGNORED_TYPES]
+
+
+def cst_path(node, root) -> Tuple[int, ...]:
+    """root에서 node까지의 자식 인덱스 경로 (cst_hash와 같이 주석은 건너뜀).
+
+    cst_hash가 같은 본문끼리는 같은 경로가 같은 위치의 노드를 가리킨다.
+    """
+    path = []
+    while node != root:
+        parent = node.parent
+        path.append(_children(parent).index(node))
+        node = parent
+    return tuple(reversed(path))
+
+
+def resolve_path(root, path: Tuple[int, ...]):
+    node = root
+    for i in path:
+        node = _children(node)[i]
+    return node
+
+
+def cfg_hash(cfg) -> str:
+    """줄 번호를 제외한 CFG 구조 해시: 노드별 (타입, 코드) 해시를 successor 목록과 함께 접는다"""
+    h = hashlib.sha1()
+    for node in cfg:
+        node_digest = hashlib.sha1(f"{node.type}\0{normalize(node.code)}".encode('utf-8')).digest()
+        h.update(node_digest)
+        h.update(f"{node.successors}".encode('utf-8'))
+    return h.hexdigest()
+
+
+def normalize(code: str) -> str:
+    return ' '.join(code.split())
+
+
+@dataclass
+class InternedBody:
+    cfg: List
+    calls: List[str]
+    cfg_hash: str
+
+
+class FunctionInterner:
+    """본문 CST 해시가 같은 함수끼리 CFG와 호출 목록을 공유.
+
+    CodeAnalyzer 여러 개에 같은 인스턴스를 넘기면 파일 간(vendored 코드) 중복도 제거된다.
+    """
+
+    def __init__(self):
+        self.bodies: Dict[str, InternedBody] = {}
+        self.functions = 0
+
+    def intern(self, body_hash: str, build: Callable[[], Tuple[List, List[str]]]) -> InternedBody:
+        """body_hash에 해당하는 본문을 반환. 처음 보는 본문이면 build()로 (cfg, calls)를 만든다"""
+        self.functions += 1
+        body = self.bodies.get(body_hash)
+        if body is None:
+            cfg, calls = build()
+            body = InternedBody(cfg, calls, cfg_hash(cfg))
+            self.bodies[body_hash] = body
+        return body
+
+    @property
+    def unique(self) -> int:
+        return len(self.bodies)
@@ -0,0 +1,48 @@
+from src.cst_gen import CodeAnalyzer
+
+
+DUPLICATES = """int dup1(int a) {
+    return a + 1;
+}
+
+int dup2(int a) {
+    // same body, different layout
+
+    return a + 1;
+}
+
+int dup3(int a) {
+    return a + 1;
+}
+"""
+
+
+def cfg_lines(func):
+    return {node.type: func.line_of(node) for node in func.cfg}
+
+
+def test_duplicate_bodies_keep_their_own_lines():
+    analyzer = CodeAnalyzer(DUPLICATES)
+    functions = analyzer.analyze()
+
+    assert cfg_lines(functions["dup1"]) == {"entry": 0, "exit": 2, "return": 1}
+    assert cfg_lines(functions["dup2"]) == {"entry": 4, "exit": 8, "return": 7}
+    assert cfg_lines(functions["dup3"]) == {"entry": 10, "exit": 12, "return": 11}
+    assert functions["dup2"].end_line == 8
+
+
+def test_layout_differences_share_cfg():
+    analyzer = CodeAnalyzer(DUPLICATES)
+    functions = analyzer.analyze()
+
+    assert functions["dup1"].cfg is functions["dup2"].cfg is functions["dup3"].cfg
+    assert analyzer.interner.functions == 3
+    assert analyzer.interner.unique == 1
+
+
+def test_comment_only_difference_shares_cfg():
+    analyzer = CodeAnalyzer("int f(int a) { return a; }\nint g(int a) { return a; /* same */ }\n")
+    functions = analyzer.analyze()
+
+    assert functions["f"].cfg is functions["g"].cfg
+    assert [node.type for node in functions["g"].cfg] == ["entry", "exit", "return"]
@@ -0,0 +1,179 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from src.graph_diff import GraphSnapshot, build_snapshot, diff_snapshots
+
+
+MAVUL = Path(__file__).resolve().parent.parent / "MAVUL"
+
+
+def make_revision(root: Path, edit=None) -> Path:
+    """MAVUL의 auth.c/logger.c를 root에 복사하고 edit(파일명 -> 코드 변환)를 적용"""
+    root.mkdir(parents=True)
+    for src in MAVUL.glob("*.c"):
+        code = src.read_text(encoding="utf-8")
+        if edit and src.name in edit:
+            code = edit[src.name](code)
+        (root / src.name).write_text(code, encoding="utf-8")
+    return root
+
+
+def edges_of(edges, rel):
+    return {(src, dst) for src, r, dst in edges if r == rel}
+
+
+def test_identical_revisions_have_empty_diff(tmp_path):
+    old = build_snapshot(str(make_revision(tmp_path / "r1")))
+    new = build_snapshot(str(make_revision(tmp_path / "r2")))
+    assert diff_snapshots(old, new).is_empty()
+
+
+def test_snapshot_save_load_round_trip(tmp_path):
+    snapshot = build_snapshot(str(make_revision(tmp_path / "r1")))
+    snapshot.save(str(tmp_path / "snapshot.json"))
+    loaded = GraphSnapshot.load(str(tmp_path / "snapshot.json"))
+
+    assert loaded.functions.keys() == snapshot.functions.keys()
+    assert diff_snapshots(loaded, snapshot).is_empty()
+    assert diff_snapshots(snapshot, loaded).is_empty()
+
+
+def test_new_caller_is_added_edge(tmp_path):
+    old = build_snapshot(str(make_revision(tmp_path / "r1")))
+    new = build_snapshot(str(make_revision(tmp_path / "r2", {
+        "auth.c": lambda code: code + "\nvoid lock_account(char* u) {\n    log_auth_failure(u);\n}\n",
+    })))
+    diff = diff_snapshots(old, new)
+
+    assert [n.key for n in diff.added_nodes if n.labels == ("Function",)] == ["auth.c:lock_account"]
+    assert edges_of(diff.added_edges, "CALLS") == {("auth.c:lock_account", "logger.c:log_auth_failure")}
+    assert not diff.removed_nodes
+    assert not diff.removed_edges
+
+
+def test_removed_function_drops_node_and_calls(tmp_path):
+    old = build_snapshot(str(make_revision(tmp_path / "r1")))
+    new = build_snapshot(str(make_revision(tmp_path / "r2", {
+        "logger.c": lambda code: code.split("void save_audit_log")[0],
+    })))
+    diff = diff_snapshots(old, new)
+
+    removed_functions = {n.key for n in diff.removed_nodes if n.labels == ("Function",)}
+    assert removed_functions == {"logger.c:save_audit_log"}
+    # 정의가 사라졌으므로 호출은 외부 함수 노드로 옮겨간다
+    assert ("logger.c:log_auth_failure", "logger.c:save_audit_log") in edges_of(diff.removed_edges, "CALLS")
+    assert ("logger.c:log_auth_failure", ":save_audit_log") in edges_of(diff.added_edges, "CALLS")
+
+
+class RecordingTx:
+    def __init__(self):
+        self.runs = []
+
+    def run(self, query, **params):
+        self.runs.append((" ".join(query.split()), params))
+
+
+def test_apply_diff_groups_writes_by_label_and_relationship(tmp_path):
+    graphdb1 = pytest.importorskip("src.graphdb1")
+
+    # '#'가 들어간 경로도 Function 라벨로 매칭되어야 한다
+    make_revision(tmp_path / "r1" / "vendor#1")
+    diff = diff_snapshots(GraphSnapshot(), build_snapshot(str(tmp_path / "r1")))
+    assert "vendor#1/auth.c:login_user" in {n.key for n in diff.added_nodes}
+
+    tx = RecordingTx()
+    graphdb1.apply_diff(tx, diff)
+
+    calls = [(q, p) for q, p in tx.runs if "MERGE (a)-[:CALLS]->(b)" in q]
+    assert len(calls) == 1
+    query, params = calls[0]
+    assert "MATCH (a:Function {key: e[0]})" in query
+    assert "MATCH (b:Function {key: e[1]})" in query
+    assert len(params["edges"]) == len(edges_of(diff.added_edges, "CALLS"))
+
+    entry = [q for q, _ in tx.runs if "MERGE (a)-[:ENTRY]->(b)" in q]
+    assert len(entry) == 1
+    assert "MATCH (a:Function" in entry[0] and "MATCH (b:CFGNode" in entry[0]
+
+    # 노드 upsert는 라벨 조합마다 한 번
+    upserts = [p for q, p in tx.runs if q.startswith("UNWIND $rows")]
+    assert len(upserts) == len({n.labels for n in diff.added_nodes})
+
+
+def test_one_statement_edit_is_one_node_delta(tmp_path):
+    old = build_snapshot(str(make_revision(tmp_path / "r1")))
+    new = build_snapshot(str(make_revision(tmp_path / "r2", {
+        "auth.c": lambda code: code.replace("log_auth_failure(username);", "lock_account(username);"),
+    })))
+    diff = diff_snapshots(old, new)
+
+    added = [n for n in diff.added_nodes if "CFGNode" in n.labels]
+    removed = [n for n in diff.removed_nodes if "CFGNode" in n.labels]
+    assert [(n.labels, n.props["function"]) for n in added] == [(("CFGNode", "Call"), "lock_account")]
+    assert [(n.labels, n.props["function"]) for n in removed] == [(("CFGNode", "Call"), "log_auth_failure")]
+    assert not diff.updated_nodes
+    assert edges_of(diff.added_edges, "CALLS") == {("auth.c:login_user", ":lock_account")}
+    assert edges_of(diff.removed_edges, "CALLS") == {("auth.c:login_user", "logger.c:log_auth_failure")}
+
+
+def test_vendored_copy_shares_cfg(tmp_path):
+    root = make_revision(tmp_path / "r1")
+    base = build_snapshot(str(root))
+    shutil.copytree(root, root / "vendor")
+    vendored = build_snapshot(str(root))
+
+    assert vendored.stats.functions == 2 * base.stats.functions
+    assert vendored.stats.unique_bodies == base.stats.unique_bodies
+    assert vendored.stats.dedupe_ratio == 0.5
+    assert vendored.stats.unique_cfgs == vendored.stats.unique_bodies
+    assert vendored.cfgs.keys() == base.cfgs.keys()
+
+    # 복사본을 지워도 owner(키가 가장 작은 함수)가 그대로이므로 CFG는 바뀌지 않는다
+    shutil.rmtree(root / "vendor")
+    diff = diff_snapshots(vendored, build_snapshot(str(root)))
+    assert not diff.updated_nodes
+    assert all(n.labels == ("Function",) for n in diff.removed_nodes)
+
+
+def branch_targets(snapshot, function, rel):
+    fg = snapshot.functions[function]
+    cg = snapshot.cfgs[fg.cfg]
+    conditions = [dst for src, r, dst in fg.edges if r == "HAS_CONDITION"]
+    return [cg.nodes[dst] for src, r, dst in cg.edges if r == rel and src in conditions]
+
+
+def test_failure_branch_reaches_call_node(tmp_path):
+    snapshot = build_snapshot(str(make_revision(tmp_path / "r1")))
+
+    [target] = branch_targets(snapshot, "auth.c:login_user", "IF_FALSE")
+    assert target.labels == ("CFGNode", "Call")
+    assert target.props["function"] == "log_auth_failure"
+
+    [target] = branch_targets(snapshot, "auth.c:login_user", "IF_TRUE")
+    assert target.props["function"] == "printf"
+
+
+def test_whitespace_only_edit_keeps_stored_code_current(tmp_path):
+    old = build_snapshot(str(make_revision(tmp_path / "r1")))
+    new = build_snapshot(str(make_revision(tmp_path / "r2", {
+        "auth.c": lambda code: code.replace('"Welcome %s!\\n", username', '"Welcome %s!\\n",     username'),
+    })))
+
+    assert diff_snapshots(old, new).is_empty()
+    # 저장되는 코드는 정규화된 텍스트라 해시가 같으면 값도 같다
+    [target] = branch_targets(new, "auth.c:login_user", "IF_TRUE")
+    assert target.props["code"] == 'printf("Welcome %s!\\n", username);'
+
+
+def test_reformatted_copy_counts_as_same_body(tmp_path):
+    root = make_revision(tmp_path / "r1")
+    (root / "vendor").mkdir()
+    reformatted = (root / "logger.c").read_text(encoding="utf-8").replace("{\n", "{\n\n    // vendored\n")
+    (root / "vendor" / "logger.c").write_text(reformatted, encoding="utf-8")
+    snapshot = build_snapshot(str(root))
+
+    assert snapshot.stats.functions == 6
+    assert snapshot.stats.unique_bodies == snapshot.stats.unique_cfgs == 4
+    assert snapshot.stats.cfg_nodes_stored < snapshot.stats.cfg_nodes_total
@@ -0,0 +1,180 @@
+import os
+import shutil
+
+import pytest
+
+from src.cst_gen import CodeAnalyzer
+from src.preprocess import CompileCommands, LineMap, Preprocessor, split_prelude
+
+
+needs_cpp = pytest.mark.skipif(shutil.which("cpp") is None, reason="cpp not available")
+
+LOG_H = """#ifndef LOG_H
+#define LOG_H
+#define LOG_FAIL(u) \\
+    log_auth_failure(u)
+#endif
+"""
+
+AUTH_C = """/* license
+ * header */
+#include "log.h"
+#define USE_AUDIT 1
+
+int login(char *u) {
+#ifdef USE_AUDIT
+    if (!check(u)) {
+        LOG_FAIL(u);
+        return 0;
+    }
+#else
+    legacy(u);
+#endif
+    return 1;
+}
+"""
+
+
+def write_project(root):
+    (root / "log.h").write_text(LOG_H, encoding="utf-8")
+    (root / "auth.c").write_text(AUTH_C, encoding="utf-8")
+    return root / "auth.c"
+
+
+def test_split_prelude_skips_comments_and_joins_continuations():
+    code = ("// leading\n/* block\n   comment */\n#include <stdlib.h>\n"
+            "#define TWICE(x) \\\n    ((x) * 2)\n\nint f(void) { return TWICE(1); }\n")
+    directives, body = split_prelude(code)
+
+    assert directives == ["#include <stdlib.h>", "#define TWICE(x) \\\n    ((x) * 2)"]
+    # prelude 줄은 빈 줄이 되어 본문의 줄 번호가 유지된다
+    assert body.split("\n")[7] == "int f(void) { return TWICE(1); }"
+    assert not any(body.split("\n")[:7])
+
+
+def test_split_prelude_stops_at_conditional():
+    directives, body = split_prelude("#include <a.h>\n#ifdef X\n#include <b.h>\n#endif\n")
+    assert directives == ["#include <a.h>"]
+    assert body.split("\n")[1] == "#ifdef X"
+
+
+def test_strip_linemarkers_maps_back_to_source():
+    out = "\n".join([
+        '# 1 "/src/a.c"',
+        "int x;",
+        '# 1 "/inc/h.h" 1',
+        "int h;",
+        '# 3 "/src/a.c" 2',
+        "int y = f(1, 2);",   # 여러 줄에 걸친 매크로 호출은 시작 줄 하나로 합쳐진다
+        '# 6 "/src/a.c"',
+        "int z;",
+    ])
+    code_lines, entries = Preprocessor._strip_linemarkers(out, "/src/a.c")
+    line_map = LineMap("/src/a.c", entries)
+
+    assert code_lines == ["int x;", "int h;", "int y = f(1, 2);", "int z;"]
+    assert [line_map.origin(i) for i in range(4)] == [
+        ("/src/a.c", 0), ("/inc/h.h", 0), ("/src/a.c", 2), ("/src/a.c", 5),
+    ]
+    assert not line_map.in_main_file(1)
+
+
+def test_filter_flags_attached_and_separate(tmp_path):
+    args = ["-Iinc", "-I", "../shared", "-DX=1", "-D", "Y", "-UZ", "-O2",
+            "-std=c99", "-include", "cfg.h", "-c", "a.c"]
+    flags = CompileCommands._filter_flags(args, str(tmp_path / "build"))
+
+    assert flags == [
+        "-I", str(tmp_path / "build" / "inc"),
+        "-I", str(tmp_path / "shared"),
+        "-D", "X=1", "-D", "Y", "-U", "Z",
+        "-std=c99",
+        "-include", str(tmp_path / "build" / "cfg.h"),
+    ]
+
+
+def test_malformed_compile_commands_is_ignored(tmp_path, capsys):
+    path = write_project(tmp_path)
+    (tmp_path / "compile_commands.json").write_text("{not json", encoding="utf-8")
+
+    assert CompileCommands.find(str(tmp_path)) is None
+    assert "compile_commands.json" in capsys.readouterr().out
+
+    with Preprocessor(cpp="/nonexistent/cpp") as preprocessor:
+        functions = CodeAnalyzer.from_file(str(path), preprocessor).analyze()
+    assert "login" in functions
+
+
+@needs_cpp
+def test_macro_call_and_ifdef_are_resolved(tmp_path):
+    path = write_project(tmp_path)
+    with Preprocessor() as preprocessor:
+        functions = CodeAnalyzer.from_file(str(path), preprocessor).analyze()
+
+    login = functions["login"]
+    assert login.calls == ["check", "log_auth_failure"]
+    assert (login.start_line, login.end_line) == (5, 15)
+    lines = {node.type: login.line_of(node) for node in login.cfg if node.type in ("call", "condition")}
+    assert lines == {"condition": 7, "call": 8}
+
+
+@needs_cpp
+def test_multiline_macro_call_and_mid_file_include(tmp_path):
+    (tmp_path / "mid.h").write_text("int from_header(void);\n", encoding="utf-8")
+    path = tmp_path / "a.c"
+    path.write_text(
+        "#define ADD(a, b) ((a) + (b))\n"
+        "int f(void) {\n"
+        "    return ADD(1,\n"
+        "               2);\n"
+        "}\n"
+        '#include "mid.h"\n'
+        "int g(void) {\n"
+        "    return from_header();\n"
+        "}\n",
+        encoding="utf-8",
+    )
+    with Preprocessor() as preprocessor:
+        pre = preprocessor.preprocess(str(path))
+
+    lines = pre.code.split("\n")
+    f_ret = next(i for i, line in enumerate(lines) if "((1) + (2))" in line)
+    g_ret = next(i for i, line in enumerate(lines) if "return from_header()" in line)
+    decl = next(i for i, line in enumerate(lines) if "int from_header(void);" in line)
+
+    assert pre.line_map.origin(f_ret) == (str(path), 2)
+    assert pre.line_map.origin(g_ret) == (str(path), 7)
+    assert pre.line_map.origin(decl) == (str(tmp_path / "mid.h"), 0)
+
+
+@needs_cpp
+def test_include_set_cache_hits_and_header_change(tmp_path):
+    path = write_project(tmp_path)
+    shutil.copy(path, tmp_path / "copy.c")
+
+    with Preprocessor() as preprocessor:
+        preprocessor.preprocess(str(path))
+        preprocessor.preprocess(str(tmp_path / "copy.c"))
+        assert (preprocessor.hits, preprocessor.misses) == (1, 1)
+
+        header = tmp_path / "log.h"
+        mtime = os.path.getmtime(header)
+        os.utime(header, (mtime + 10, mtime + 10))
+        preprocessor.preprocess(str(path))
+        assert (preprocessor.hits, preprocessor.misses) == (1, 2)
+
+
+@needs_cpp
+def test_cache_dir_is_reused_across_instances(tmp_path):
+    (tmp_path / "src").mkdir()
+    path = write_project(tmp_path / "src")
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+
+    first = Preprocessor(cache_dir=str(cache_dir))
+    first.preprocess(str(path))
+    assert first.misses == 1
+
+    second = Preprocessor(cache_dir=str(cache_dir))
+    second.preprocess(str(path))
+    assert (second.hits, second.misses) == (1, 0)